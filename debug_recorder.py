@@ -4,6 +4,9 @@ import numpy as np
 import time
 import os
 import wave
+import io
+import struct
+import threading
 import assemblyai as aai
 from dotenv import load_dotenv
 
@@ -13,50 +16,89 @@ load_dotenv()
 # Configuration
 SAMPLE_RATE = 16000
 CHANNELS = 1
-TEMP_AUDIO_FILE = "recording.wav"
+UPLOAD_ULAW = True  # Upload 8-bit G.711 u-law (half the bytes of PCM16)
+ULAW_SEG_END = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+WAV_HEADER_SIZE = 44  # wave always writes a canonical 44-byte PCM header
 
 def record_audio(duration=5):
-    """Record audio for a specified duration in seconds"""
+    """Record audio for a specified duration, streaming it into an in-memory WAV file"""
     st.write(f"Recording for {duration} seconds...")
     
-    # Record audio
-    audio_data = sd.rec(
-        int(duration * SAMPLE_RATE),
+    bio = io.BytesIO()
+    wf = wave.open(bio, 'wb')
+    wf.setnchannels(CHANNELS)
+    wf.setsampwidth(2)  # 16-bit audio (2 bytes)
+    wf.setframerate(SAMPLE_RATE)
+    
+    total = int(duration * SAMPLE_RATE)
+    frame_bytes = CHANNELS * 2
+    written = 0
+    finished = threading.Event()
+    
+    def callback(indata, frames, time_info, status):
+        nonlocal written
+        n = min(frames, total - written)
+        # Header is patched once on close, not after every block
+        wf.writeframesraw(memoryview(indata)[:n * frame_bytes])
+        written += n
+        if written >= total:
+            raise sd.CallbackStop
+    
+    # Each block goes straight into the WAV; no full-length array is kept
+    with sd.RawInputStream(
         samplerate=SAMPLE_RATE,
         channels=CHANNELS,
-        dtype='int16'
-    )
+        dtype='int16',
+        callback=callback,
+        finished_callback=finished.set
+    ):
+        finished.wait()
+    wf.close()
     
-    # Wait for the recording to complete
-    sd.wait()
+    wav_bytes = bio.getvalue()
+    st.write(f"Recording complete! Audio encoded in memory (Size: {len(wav_bytes)} bytes)")
     
-    st.write("Recording complete!")
-    return audio_data
+    return wav_bytes
 
-def save_audio(audio_data, filename=TEMP_AUDIO_FILE):
-    """Save audio data to a WAV file"""
-    with wave.open(filename, 'wb') as wf:
-        wf.setnchannels(CHANNELS)
-        wf.setsampwidth(2)  # 16-bit audio (2 bytes)
-        wf.setframerate(SAMPLE_RATE)
-        wf.writeframes(audio_data.tobytes())
-    
-    # Verify the file was created
-    file_size = os.path.getsize(filename)
-    st.write(f"Audio saved to {filename} (Size: {file_size} bytes)")
+def lin2ulaw(audio_data):
+    """Encode int16 samples as G.711 u-law bytes (same output as audioop.lin2ulaw)"""
+    pcm = audio_data.reshape(-1).astype(np.int32) >> 2  # 14-bit range
+    mask = np.where(pcm < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(pcm), 8159) + 33
+    seg = np.searchsorted(ULAW_SEG_END, magnitude)
+    uval = (seg << 4) | ((magnitude >> (seg + 1)) & 0xF)
+    uval[seg >= 8] = 0x7F
+    return (uval ^ mask).astype(np.uint8).tobytes()
+
+def build_ulaw_wav_bytes(audio_data):
+    """Encode audio data as an in-memory u-law WAV file (format tag 7)"""
+    data = lin2ulaw(audio_data)
+    nframes = len(data) // CHANNELS
+    pad = b'\0' * (len(data) % 2)
+    # The wave module only writes PCM, so lay out the RIFF chunks by hand
+    header = struct.pack(
+        '<4sI4s4sIHHIIHHH4sII4sI',
+        b'RIFF', 4 + 26 + 12 + 8 + len(data) + len(pad), b'WAVE',
+        b'fmt ', 18, 7, CHANNELS, SAMPLE_RATE, SAMPLE_RATE * CHANNELS,
+        CHANNELS, 8, 0,
+        b'fact', 4, nframes,
+        b'data', len(data)
+    )
+    wav_bytes = header + data + pad
+    st.write(f"Audio encoded as u-law for upload (Size: {len(wav_bytes)} bytes)")
     
-    return filename
+    return wav_bytes
 
-def transcribe_audio(filename, api_key):
-    """Transcribe audio file using AssemblyAI"""
+def transcribe_audio(wav_bytes, api_key):
+    """Transcribe in-memory WAV data using AssemblyAI"""
     st.write(f"Setting API key: {api_key[:5]}...{api_key[-4:]}")
     aai.settings.api_key = api_key
     
     st.write("Creating transcriber...")
     transcriber = aai.Transcriber()
     
-    st.write(f"Sending file {filename} to AssemblyAI...")
-    transcript = transcriber.transcribe(filename)
+    st.write(f"Uploading {len(wav_bytes)} bytes to AssemblyAI...")
+    transcript = transcriber.transcribe(wav_bytes)
     
     st.write(f"Transcription complete. Status: {transcript.status}")
     
@@ -104,19 +146,22 @@ if st.button("Record and Transcribe"):
         try:
             # Record audio
             with st.spinner("Recording..."):
-                audio_data = record_audio(duration)
-            
-            # Save the audio
-            with st.spinner("Saving audio..."):
-                audio_file = save_audio(audio_data)
+                wav_bytes = record_audio(duration)
             
             # Display audio player
-            st.audio(audio_file)
+            st.audio(wav_bytes, format="audio/wav")
+            
+            # Browsers only play PCM WAV, so u-law is used for the upload alone
+            if UPLOAD_ULAW:
+                audio_data = np.frombuffer(wav_bytes, dtype=np.int16, offset=WAV_HEADER_SIZE)
+                upload_bytes = build_ulaw_wav_bytes(audio_data)
+            else:
+                upload_bytes = wav_bytes
             
             # Transcribe
             with st.spinner("Transcribing audio with AssemblyAI..."):
                 st.write("Starting transcription process...")
-                result = transcribe_audio(audio_file, api_key)
+                result = transcribe_audio(upload_bytes, api_key)
                 
                 # Add timestamp for display
                 result['timestamp'] = time.strftime("%H:%M:%S")
@@ -144,5 +189,8 @@ if st.session_state.transcriptions:
             # Display words with timestamps if available
             if t['words']:
                 st.subheader("Words with Timestamps")
-                for word in t['words']:
-                    st.write(f"[{word['start']:.2f}s - {word['end']:.2f}s] {word['text']}")
+                # One element for the whole list instead of one per word
+                st.text("\n".join(
+                    f"[{word['start']:.2f}s - {word['end']:.2f}s] {word['text']}"
+                    for word in t['words']
+                ))
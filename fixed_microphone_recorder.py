@@ -6,21 +6,41 @@ import os
 import wave
 import assemblyai as aai
 import threading
-import queue
 from dotenv import load_dotenv
 import uuid
 import tempfile
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from recorder_common import RingBuffer, keep_errors, get_transcriber, cached_transcribe
 
 # Load environment variables
 load_dotenv()
 
 # Configuration
-SAMPLE_RATE = 44100  # Higher sample rate for better quality
+SAMPLE_RATE = 16000  # Speech-recognition rate; ASR gains nothing above 8 kHz audio
 CHANNELS = 1
 RECORDINGS_DIR = "recordings"
+RING_SECONDS = 10       # How far the WAV writer may lag behind the mic
+BLOCKSIZE = 2048        # Frames per callback (128 ms): fewer Python wakeups
+TRANSCRIBE_WORKERS = 2  # Concurrent AssemblyAI jobs per session
+CACHE_DIR = ".fixed_mic_transcripts"  # Transcripts keyed by audio content hash
+PAGE_SIZE = 10          # Recordings shown before "Show older" is ticked
+DEBUG_LOG_LINES = 500   # Oldest debug messages are dropped beyond this
+MAX_PENDING = 4         # Transcriptions allowed in flight before Stop waits
+POLLING_INTERVAL = 5.0  # Seconds between AssemblyAI status checks
+KEEPALIVE_EXPIRY = 60.0  # Seconds an idle AssemblyAI connection stays pooled
 
-# Create recordings directory if it doesn't exist
+# Transcription runs off the UI thread, so trade a little latency for
+# fewer status requests per transcript (SDK default is 3 seconds)
+aai.settings.polling_interval = POLLING_INTERVAL
+# httpx drops idle connections after 5s, i.e. just before every poll;
+# keep them alive so uploads and polls reuse one TLS connection
+aai.settings.keepalive_expiry = KEEPALIVE_EXPIRY
+
+# Create recordings and transcript cache directories if they don't exist
 os.makedirs(RECORDINGS_DIR, exist_ok=True)
+os.makedirs(CACHE_DIR, exist_ok=True)
 
 # Initialize session state for recording status
 if 'is_recording' not in st.session_state:
@@ -30,11 +50,13 @@ if 'recordings' not in st.session_state:
 if 'recording_start_time' not in st.session_state:
     st.session_state.recording_start_time = 0
 if 'debug' not in st.session_state:
-    st.session_state.debug = []
-if 'audio_frames' not in st.session_state:
-    st.session_state.audio_frames = []
+    st.session_state.debug = deque(maxlen=DEBUG_LOG_LINES)
 if 'selected_device' not in st.session_state:
     st.session_state.selected_device = None
+if 'executor' not in st.session_state:
+    st.session_state.executor = ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS)
+if 'transcribe_slots' not in st.session_state:
+    st.session_state.transcribe_slots = threading.BoundedSemaphore(MAX_PENDING)
 
 # Add debug message function
 def add_debug(msg):
@@ -42,8 +64,9 @@ def add_debug(msg):
     st.session_state.debug.append(f"{time.strftime('%H:%M:%S')}: {msg}")
 
 # Function to get audio devices
+@st.cache_resource
 def get_audio_devices():
-    """Get list of available audio input devices"""
+    """Get list of available audio input devices (cached until Refresh Devices)"""
     devices = sd.query_devices()
     input_devices = []
     
@@ -56,55 +79,113 @@ def get_audio_devices():
                 'default': device.get('default_input', False)
             })
     
-    add_debug(f"Found {len(input_devices)} input devices")
-    return input_devices
-
-# Simple fixed-duration recording approach
-def record_audio_simple(duration, device_index=None):
-    """Record audio for a fixed duration"""
-    add_debug(f"Starting simple recording for {duration} seconds" + 
-             (f" on device {device_index}" if device_index is not None else ""))
+    # Selectbox options are device indices (None = default) mapped to labels
+    labels = {None: "Default"}
+    labels.update({d['index']: f"{d['name']} (Index: {d['index']})" for d in input_devices})
+    return input_devices, labels
+
+# Streamed recording: PortAudio callback -> ring buffer -> writer thread -> WAV
+def write_frames(ring, wf, stop_event, hasher):
+    """Drain the ring into an open WAV file (and hasher) until recording stops"""
+    while True:
+        stopping = stop_event.is_set()
+        for block in ring.drain():
+            # Raw write: wave patches the header once on close, not per block
+            wf.writeframesraw(block)
+            hasher.update(block)
+        if stopping:
+            break
+        stop_event.wait(0.05)
+
+def start_capture(filepath, device_index, max_seconds):
+    """Open the WAV file and start streaming the microphone into it"""
+    rate = SAMPLE_RATE
+    try:
+        sd.check_input_settings(device=device_index, channels=CHANNELS, dtype='int16', samplerate=rate)
+    except sd.PortAudioError:
+        # Each recording is transcribed on its own, so any rate will do
+        rate = int(sd.query_devices(device_index, 'input')['default_samplerate'])
+        add_debug(f"Device does not support {SAMPLE_RATE} Hz, recording at {rate} Hz")
+    ring = RingBuffer(RING_SECONDS * rate, CHANNELS)
+    max_frames = int(max_seconds * rate)
+    
+    def callback(indata, frames, time_info, status):
+        if ring.write_idx >= max_frames:
+            raise sd.CallbackStop
+        ring.write(indata)
     
+    stream = sd.RawInputStream(
+        samplerate=rate,
+        channels=CHANNELS,
+        device=device_index,
+        dtype='int16',
+        blocksize=BLOCKSIZE,
+        latency='high',  # Nothing is monitored live, so favour large buffers
+        callback=callback
+    )
+    stop_event = threading.Event()
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(rate.to_bytes(4, 'little'))  # Same samples at another rate are other audio
+    wf = writer = None
+    errors = []  # Filled by the writer if a disk write fails
     try:
-        # Use the blocking recording approach
-        recording = sd.rec(
-            int(duration * SAMPLE_RATE),
-            samplerate=SAMPLE_RATE,
-            channels=CHANNELS,
-            device=device_index,
-            dtype='int16'
-        )
-        # Wait for the recording to complete
-        sd.wait()
-        
-        add_debug(f"Finished recording, shape: {recording.shape}")
-        return recording
-    except Exception as e:
-        add_debug(f"Error in simple recording: {str(e)}")
-        raise e
-
-def save_audio(audio_data, filename):
-    """Save audio data to a WAV file"""
-    filepath = os.path.join(RECORDINGS_DIR, filename)
-    with wave.open(filepath, 'wb') as wf:
+        wf = wave.open(filepath, 'wb')
         wf.setnchannels(CHANNELS)
         wf.setsampwidth(2)  # 16-bit audio (2 bytes)
-        wf.setframerate(SAMPLE_RATE)
-        wf.writeframes(audio_data.tobytes())
-    
-    # Get absolute path for the file
-    abs_path = os.path.abspath(filepath)
-    add_debug(f"Saved audio to {abs_path} ({os.path.getsize(filepath)} bytes)")
+        wf.setframerate(rate)
+        writer = threading.Thread(
+            target=keep_errors, args=(errors, write_frames, ring, wf, stop_event, hasher), daemon=True)
+        writer.start()
+        stream.start()
+    except Exception:
+        # Leave no running writer, open stream or half-written file behind
+        stop_event.set()
+        if writer is not None and writer.is_alive():
+            writer.join()
+        stream.close()
+        if wf is not None:
+            wf.close()
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        raise
     
-    return filepath
+    add_debug(f"Streaming to {filepath}" +
+              (f" from device {device_index}" if device_index is not None else ""))
+    return {
+        'stream': stream, 'ring': ring, 'wf': wf,
+        'stop_event': stop_event, 'writer': writer, 'filepath': filepath,
+        'rate': rate, 'errors': errors, 'hasher': hasher
+    }
 
-def transcribe_audio(filepath, api_key):
-    """Transcribe audio file using AssemblyAI"""
-    aai.settings.api_key = api_key
+def stop_capture(capture):
+    """Stop the stream, flush the writer and close the WAV file; returns frames captured"""
+    capture['stream'].stop()
+    capture['stream'].close()
+    capture['stop_event'].set()
+    capture['writer'].join()
+    try:
+        if capture['errors']:
+            raise capture['errors'][0]
+        capture['wf'].close()
+    except Exception:
+        # A take the writer could not finish is not kept as if it were whole
+        try:
+            capture['wf'].close()
+        except Exception:
+            pass
+        os.remove(capture['filepath'])
+        raise
     
-    add_debug(f"Transcribing audio file: {filepath}")
-    transcriber = aai.Transcriber()
+    ring = capture['ring']
+    if ring.overflows:
+        add_debug(f"Dropped {ring.overflows} blocks (writer overrun)")
+    return ring.write_idx
+
+def transcribe_audio(filepath, transcriber):
+    """Transcribe audio file using AssemblyAI (runs on a worker thread)"""
     transcript = transcriber.transcribe(filepath)
+    if transcript.status == aai.TranscriptStatus.error:
+        raise RuntimeError(transcript.error)
     
     # Extract words with timestamps if available
     words = []
@@ -115,53 +196,89 @@ def transcribe_audio(filepath, api_key):
             'end': word.end / 1000.0       # Convert ms to seconds
         } for word in transcript.words]
     
-    add_debug(f"Transcription completed: {transcript.text[:30]}..." if transcript.text else "No transcription")
-    
     return {
         'text': transcript.text if transcript.text else "No transcription available",
         'words': words
     }
 
+def submit_transcription(filepath, api_key, digest=None):
+    """Queue a transcription on the worker pool; None if the backlog is full"""
+    slots = st.session_state.transcribe_slots
+    transcriber = get_transcriber(api_key)
+    # Never block the script thread waiting for a slot
+    if not slots.acquire(blocking=False):
+        add_debug(f"Transcription queue full, skipped {filepath}")
+        return None
+    add_debug(f"Queueing transcription: {filepath}")
+    
+    def task():
+        try:
+            return cached_transcribe(
+                CACHE_DIR, filepath, lambda p: transcribe_audio(p, transcriber), digest)
+        finally:
+            slots.release()
+    
+    return st.session_state.executor.submit(task)
+
+def collect_transcriptions():
+    """Move finished background transcriptions into their recordings"""
+    for recording in st.session_state.recordings:
+        future = recording.get('future')
+        if future is None or not future.done():
+            continue
+        try:
+            recording['transcription'] = future.result()
+            text = recording['transcription']['text']
+            add_debug(f"Transcription completed: {text[:30]}...")
+        except Exception as e:
+            recording['transcription'] = {
+                'text': f"Transcription failed: {str(e)}",
+                'words': []
+            }
+            add_debug(f"Transcription error for {recording['filename']}: {str(e)}")
+        recording['future'] = None
+
+# Saved recordings never change, so each file is read from disk only once
+@st.cache_resource(max_entries=4 * PAGE_SIZE, show_spinner=False)
+def get_audio_bytes(filepath):
+    with open(filepath, 'rb') as f:
+        return f.read()
+
 # Streamlit UI
 st.title("Voice Recorder")
 
 # Audio device selection
-devices = get_audio_devices()
-device_options = ["Default"] + [f"{d['name']} (Index: {d['index']})" for d in devices]
-
 with st.expander("Audio Settings", expanded=False):
-    selected_device_name = st.selectbox(
+    refresh = st.button("Refresh Devices")
+    if refresh:
+        get_audio_devices.clear()
+    devices, device_labels = get_audio_devices()
+    if refresh:
+        add_debug(f"Found {len(devices)} input devices")
+    
+    # The selectbox returns the device index itself, no label parsing
+    st.session_state.selected_device = st.selectbox(
         "Select Microphone",
-        options=device_options,
+        options=list(device_labels),
+        format_func=device_labels.get,
         index=0
     )
     
-    # Extract device index from selection
-    if selected_device_name != "Default":
-        device_index = int(selected_device_name.split("Index: ")[1].strip(")"))
-        st.session_state.selected_device = device_index
-    else:
-        st.session_state.selected_device = None
-    
     # Test audio button
     if st.button("Test Microphone"):
         with st.spinner("Testing microphone for 3 seconds..."):
             try:
-                test_recording = record_audio_simple(3, st.session_state.selected_device)
-                
-                # Save to a temporary file
+                # Stream the test straight into a temporary file
                 with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as f:
                     temp_file = f.name
                 
-                with wave.open(temp_file, 'wb') as wf:
-                    wf.setnchannels(CHANNELS)
-                    wf.setsampwidth(2)
-                    wf.setframerate(SAMPLE_RATE)
-                    wf.writeframes(test_recording.tobytes())
+                capture = start_capture(temp_file, st.session_state.selected_device, 3)
+                time.sleep(3)
+                test_frames = stop_capture(capture)
                 
                 st.audio(temp_file)
                 st.success("Microphone test successful!")
-                add_debug(f"Microphone test successful, audio shape: {test_recording.shape}")
+                add_debug(f"Microphone test successful, captured {test_frames} frames")
             except Exception as e:
                 st.error(f"Microphone test failed: {str(e)}")
                 add_debug(f"Microphone test failed: {str(e)}")
@@ -189,9 +306,21 @@ with col1:
         if not api_key:
             st.error("Please enter your AssemblyAI API key first")
         else:
-            st.session_state.is_recording = True
-            st.session_state.recording_start_time = time.time()
-            add_debug("Started recording process")
+            # Audio streams into a unique file until Stop names it by content
+            filename = f"recording_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.wav"
+            filepath = os.path.join(RECORDINGS_DIR, filename)
+            try:
+                st.session_state.capture = start_capture(
+                    filepath,
+                    st.session_state.selected_device,
+                    recording_duration
+                )
+                st.session_state.is_recording = True
+                st.session_state.recording_start_time = time.time()
+                add_debug("Started recording process")
+            except Exception as e:
+                st.error(f"Error starting recording: {str(e)}")
+                add_debug(f"Recording error: {str(e)}")
             st.rerun()
 
 with col2:
@@ -199,62 +328,72 @@ with col2:
         if st.session_state.is_recording:
             st.session_state.is_recording = False
             add_debug("Stopped recording process")
-            
-            # Get the elapsed time
-            elapsed = time.time() - st.session_state.recording_start_time
-            actual_duration = min(elapsed, recording_duration)
+            capture = st.session_state.capture
+            filepath = capture['filepath']
             
             try:
-                # Record audio using simple approach
-                audio_data = record_audio_simple(
-                    actual_duration, 
-                    st.session_state.selected_device
-                )
+                frames = stop_capture(capture)
                 
-                if len(audio_data) > 0:
-                    add_debug(f"Recorded audio with shape: {audio_data.shape}")
+                if frames > 0:
+                    actual_duration = frames / capture['rate']
+                    # Name the take by the hash its writer kept: an identical
+                    # take is stored once and the cache needs no second pass
+                    digest = capture['hasher'].hexdigest()
+                    filename = f"rec_{digest}.wav"
+                    final_path = os.path.join(RECORDINGS_DIR, filename)
+                    if os.path.exists(final_path):
+                        os.remove(filepath)
+                        add_debug(f"Identical take already saved: {final_path}")
+                    else:
+                        os.replace(filepath, final_path)
+                    filepath = final_path
+                    size = os.path.getsize(filepath)
+                    add_debug(f"Saved audio to {os.path.abspath(filepath)} ({size} bytes)")
+                    
+                    # Transcribe audio in the background
+                    future = submit_transcription(filepath, api_key, digest)
                     
-                    # Create a unique filename
-                    filename = f"recording_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.wav"
+                    # Create recording data
+                    recording = {
+                        'id': uuid.uuid4().hex,
+                        'filename': filename,
+                        'filepath': filepath,
+                        'duration': actual_duration,
+                        'size': size,
+                        'timestamp': time.strftime("%Y-%m-%d %H:%M:%S"),
+                        # Shown in place of the text when the queue was full
+                        'transcription': None if future else {
+                            'text': "Not transcribed: the transcription queue was full, please record again shortly",
+                            'words': []
+                        },
+                        'future': future
+                    }
                     
-                    # Save audio file
-                    filepath = save_audio(audio_data, filename)
+                    # Add to recordings list
+                    st.session_state.recordings.append(recording)
+                    add_debug(f"Added new recording: {filename}")
                     
-                    # Check if file exists and has content
-                    if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
-                        # Transcribe audio
-                        with st.spinner("Transcribing audio..."):
-                            transcription = transcribe_audio(filepath, api_key)
-                        
-                        # Create recording data
-                        recording = {
-                            'id': uuid.uuid4().hex,
-                            'filename': filename,
-                            'filepath': filepath,
-                            'duration': actual_duration,
-                            'timestamp': time.strftime("%Y-%m-%d %H:%M:%S"),
-                            'transcription': transcription
-                        }
-                        
-                        # Add to recordings list
-                        st.session_state.recordings.append(recording)
-                        add_debug(f"Added new recording: {filename}")
-                        
-                        st.success(f"Recording saved and transcribed! Duration: {actual_duration:.2f} seconds")
+                    if future:
+                        st.success(f"Recording saved, transcribing in the background. Duration: {actual_duration:.2f} seconds")
                     else:
-                        st.error(f"Failed to save audio file or file is empty")
-                        add_debug(f"File error: exists={os.path.exists(filepath)}, size={os.path.getsize(filepath) if os.path.exists(filepath) else 0}")
+                        st.warning("Recording saved, but the transcription queue is full")
                 else:
+                    os.remove(filepath)
                     st.warning("No audio was recorded. Please check your microphone.")
                     add_debug("No audio data captured")
             except Exception as e:
-                st.error(f"Error recording audio: {str(e)}")
+                # Kept until after the rerun below, which would wipe an st.error
+                st.session_state.record_error = f"Error recording audio: {str(e)}"
                 add_debug(f"Recording error: {str(e)}")
             
             st.rerun()
 
-# Recording status
-if st.session_state.is_recording:
+if 'record_error' in st.session_state:
+    st.error(st.session_state.pop('record_error'))
+
+# Recording status, refreshed on its own without rerunning the whole script
+@st.fragment(run_every=1)
+def recording_status():
     elapsed_time = time.time() - st.session_state.recording_start_time
     remaining = max(0, recording_duration - elapsed_time)
     
@@ -262,54 +401,68 @@ if st.session_state.is_recording:
     st.progress(progress)
     
     st.write(f"Recording... {elapsed_time:.1f}s / {recording_duration}s (Remaining: {remaining:.1f}s)")
-    
-    # Auto-refresh while recording to update timer
-    time.sleep(0.1)
-    st.rerun()
+
+if st.session_state.is_recording:
+    recording_status()
+
+# Pick up transcriptions finished since the last run
+collect_transcriptions()
 
 # Display recordings count
 st.write(f"Number of recordings: {len(st.session_state.recordings)}")
 
-# Display all recordings
-for i, recording in enumerate(reversed(st.session_state.recordings)):
+# Display the newest recordings; older ones only on request
+recordings = st.session_state.recordings
+oldest = 0
+if len(recordings) > PAGE_SIZE and not st.checkbox(f"Show older recordings ({len(recordings) - PAGE_SIZE})"):
+    oldest = len(recordings) - PAGE_SIZE
+for i in range(len(recordings) - 1, oldest - 1, -1):
+    recording = recordings[i]
     st.markdown("---")
-    st.subheader(f"Recording {len(st.session_state.recordings) - i}")
+    st.subheader(f"Recording {i + 1}")
     
     # Display the audio file
     try:
-        st.audio(recording['filepath'])
+        st.audio(get_audio_bytes(recording['filepath']), format="audio/wav")
         st.write(f"📅 {recording['timestamp']} | ⏱️ {recording['duration']:.2f}s")
-        st.write(f"📝 {recording['transcription']['text']}")
+        if recording['transcription'] is None:
+            st.write("⏳ Transcribing...")
+        else:
+            st.write(f"📝 {recording['transcription']['text']}")
     except Exception as e:
         st.error(f"Error playing audio: {str(e)}")
         st.write(f"File path: {recording['filepath']}")
         st.write(f"File exists: {os.path.exists(recording['filepath'])}")
         
-    # Add a download button for each recording
+    # Same cached bytes as the player, so this costs no extra file read
     try:
-        with open(recording['filepath'], "rb") as file:
-            st.download_button(
-                label="Download Audio",
-                data=file,
-                file_name=recording['filename'],
-                mime="audio/wav",
-                key=f"download_{i}"
-            )
+        st.download_button(
+            label=f"Download Audio ({recording['size'] // 1024} KB)",
+            data=get_audio_bytes(recording['filepath']),
+            file_name=recording['filename'],
+            mime="audio/wav",
+            key=f"download_{recording['id']}"
+        )
     except Exception as e:
         st.error(f"Error creating download button: {str(e)}")
 
-# Debug information in expander
-with st.expander("Debug Information", expanded=False):
+# Debug information, only built while shown and refreshed on its own
+@st.fragment
+def debug_information():
     st.write("Debug Log:")
-    for msg in st.session_state.debug:
-        st.write(msg)
+    # One element for the whole log instead of one per message
+    st.code("\n".join(st.session_state.debug), language=None)
     
     st.write("Recordings Directory:")
     if os.path.exists(RECORDINGS_DIR):
-        files = os.listdir(RECORDINGS_DIR)
-        for file in files:
-            file_path = os.path.join(RECORDINGS_DIR, file)
-            st.write(f"{file}: {os.path.getsize(file_path)} bytes")
+        # Sizes of this session's recordings were stored when they were saved
+        known_sizes = {r['filepath']: r['size'] for r in st.session_state.recordings}
+        with os.scandir(RECORDINGS_DIR) as entries:
+            for entry in entries:
+                size = known_sizes.get(entry.path)
+                if size is None:
+                    size = entry.stat().st_size
+                st.write(f"{entry.name}: {size} bytes")
     else:
         st.write("Recordings directory doesn't exist!")
     
@@ -317,3 +470,16 @@ with st.expander("Debug Information", expanded=False):
         st.session_state.recordings = []
         add_debug("Cleared all recordings")
         st.rerun()
+
+if st.toggle("Show Debug Information", key="show_debug"):
+    debug_information()
+
+# Watch background transcriptions; rerun the page only once one finishes
+@st.fragment(run_every=1)
+def transcription_watcher():
+    pending = [r['future'] for r in st.session_state.recordings if r.get('future') is not None]
+    if any(future.done() for future in pending):
+        st.rerun()
+
+if any(r.get('future') is not None for r in st.session_state.recordings):
+    transcription_watcher()
@@ -0,0 +1,165 @@
+import streamlit as st
+import numpy as np
+import time
+import os
+import assemblyai as aai
+import uuid
+import hashlib
+import json
+import mmap
+import re
+
+# Helpers shared by voice_recorder_enhanced_mic.py and fixed_microphone_recorder.py
+
+CACHE_TTL = 30 * 24 * 3600  # Seconds before a cached transcript is redone
+CACHE_MAX_ENTRIES = 1000    # Least recently used entries beyond this are pruned
+CACHE_TMP_MAX_AGE = 3600    # Seconds before an unfinished .tmp write is swept
+# Only files named like our own entries and temp writes are ever pruned
+CACHE_ENTRY_NAME = re.compile(r'[0-9a-f]{32}\.json')
+CACHE_TMP_NAME = re.compile(r'[0-9a-f]{32}\.json\.[0-9a-f]{8}\.tmp')
+
+# Built once and shared by every transcription instead of per call
+TRANSCRIPTION_CONFIG = aai.TranscriptionConfig(punctuate=True, format_text=True)
+
+# Lock-free capture buffer
+
+
+class RingBuffer:
+    """Single-producer/single-consumer ring of raw audio frames, no locks"""
+
+    def __init__(self, frames, channels, dtype='int16'):
+        self.buf = np.empty((frames, channels), dtype=dtype)
+        # Byte view of the same memory for copying raw PortAudio buffers
+        self.raw = memoryview(self.buf).cast('B')
+        self.frame_bytes = channels * self.buf.itemsize
+        self.size = frames
+        self.write_idx = 0
+        self.read_idx = 0
+        self.overflows = 0
+
+    def write(self, data):
+        """Copy a block of raw interleaved frames (any bytes-like buffer)."""
+        nbytes = len(data)
+        n = nbytes // self.frame_bytes
+        if self.write_idx + n - self.read_idx > self.size:
+            # Writer fell too far behind; drop the block rather than block
+            self.overflows += 1
+            return
+        start = (self.write_idx % self.size) * self.frame_bytes
+        end = start + nbytes
+        if end <= len(self.raw):
+            self.raw[start:end] = data
+        else:
+            data = memoryview(data)
+            split = len(self.raw) - start
+            self.raw[start:] = data[:split]
+            self.raw[:end - len(self.raw)] = data[split:]
+        self.write_idx += n
+
+    def drain(self):
+        """Yield views over all unread frames, releasing them once iterated."""
+        end = self.write_idx
+        start = self.read_idx
+        if start == end:
+            return
+        lo, hi = start % self.size, end % self.size
+        if lo < hi:
+            yield self.buf[lo:hi]
+        else:
+            yield self.buf[lo:]
+            if hi:
+                yield self.buf[:hi]
+        self.read_idx = end
+
+
+
+def keep_errors(errors, target, *args):
+    """Thread target running ``target(*args)``; an exception is kept for the joiner"""
+    try:
+        target(*args)
+    except Exception as e:
+        errors.append(e)
+
+# AssemblyAI client
+
+
+@st.cache_resource
+def get_transcriber(api_key, max_workers=1):
+    """One Transcriber per API key, so its HTTP client stays warm between jobs"""
+    settings = aai.settings.copy()  # Keeps the caller's polling and keepalive tuning
+    settings.api_key = api_key
+    return aai.Transcriber(
+        client=aai.Client(settings=settings),
+        config=TRANSCRIPTION_CONFIG,
+        max_workers=max_workers
+    )
+
+# Transcript cache keyed by audio content
+
+
+def audio_digest(path):
+    """blake2b of the file contents, hashed straight from the page cache"""
+    with open(path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return hashlib.blake2b(mm, digest_size=16).hexdigest()
+
+
+def prune_cache(cache_dir):
+    """Best effort: drop LRU transcripts beyond the cap and dead .tmp files"""
+    now = time.time()
+    entries, stale = [], []
+    try:
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                is_entry = CACHE_ENTRY_NAME.fullmatch(entry.name)
+                if not is_entry and not CACHE_TMP_NAME.fullmatch(entry.name):
+                    continue
+                try:
+                    # Another worker may rename or prune it under us
+                    mtime = entry.stat().st_mtime
+                except OSError:
+                    continue
+                if is_entry:
+                    entries.append((mtime, entry.path))
+                elif now - mtime > CACHE_TMP_MAX_AGE:
+                    # Left behind by a worker that died mid-write; live ones are
+                    # younger than any transcription and must not be touched
+                    stale.append((mtime, entry.path))
+    except OSError:
+        return
+    entries.sort()
+    for _, path in entries[:max(0, len(entries) - CACHE_MAX_ENTRIES)] + stale:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def cached_transcribe(cache_dir, path, transcribe, digest=None):
+    """Run ``transcribe(path)`` once per distinct audio; repeats are served from disk"""
+    cache_path = os.path.join(cache_dir, f"{digest or audio_digest(path)}.json")
+    try:
+        if time.time() - os.path.getmtime(cache_path) < CACHE_TTL:
+            with open(cache_path) as f:
+                result = json.load(f)
+            if 'words' in result:  # Entries from before word timings are redone
+                os.utime(cache_path)  # Mark as recently used
+                return result
+    except (OSError, ValueError, KeyError):
+        pass
+
+    result = transcribe(path)
+    # The transcript is paid for by now: failing to cache it must not fail the job.
+    # Write-then-rename so concurrent workers never see a partial file
+    tmp_path = f"{cache_path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    prune_cache(cache_dir)
+    return result
@@ -3,24 +3,53 @@ import sounddevice as sd
 import numpy as np
 import time
 import os
-import wave
 import assemblyai as aai
 from dotenv import load_dotenv
 import uuid
+import threading
+import hashlib
+import mmap
+import struct
+from bisect import bisect_right
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from recorder_common import RingBuffer, keep_errors, get_transcriber, cached_transcribe
 
 # Load environment variables
 load_dotenv()
 
 # Configuration
-SAMPLE_RATE = 44100  # Sample rate (Hz)
+SAMPLE_RATE = 16000  # Sample rate (Hz), the rate AssemblyAI transcribes at
 CHANNELS = 1         # Mono audio
 RECORDINGS_DIR = "recordings"
 COMBINED_DIR = "combined"
 TAG_OPTIONS = ["💖 Personal", "❓ Question", "⚡ Priority", "😎 Chill"]
+RING_SECONDS = 10    # How far the WAV writer may lag behind the mic
+BLOCKSIZE_OPTIONS = [0, 256, 512, 1024, 2048, 4096]  # Frames per callback, 0 = PortAudio's choice
+CALLBACK_PRIORITY = 80  # SCHED_FIFO priority for the PortAudio callback
+WRITER_PRIORITY = 60    # SCHED_FIFO priority for the WAV writer thread
+TRANSCRIBE_WORKERS = 5  # Concurrent AssemblyAI jobs across all sessions
+CACHE_DIR = ".enhanced_mic_transcripts"  # Transcripts keyed by audio content hash
+PAGE_SIZE = 10          # Recordings rendered before "Show older" is ticked
+DEBUG_LOG_LINES = 500   # Oldest debug messages are dropped beyond this
+COPY_BLOCK = 1 << 16    # Samples copied per step when combining
+CHUNK_SECONDS = 120     # Longer audio is transcribed as parallel chunks
+CHUNK_OVERLAP = 0.5     # Seconds of context either side of a chunk
+MIN_CHUNK_SECONDS = 10  # A shorter final chunk is merged into the one before
+WAV_HEADER_SIZE = 44    # Canonical PCM header, no extra chunks
+
+KEEPALIVE_EXPIRY = 60.0  # Seconds an idle AssemblyAI connection stays pooled
+
+# Ask PortAudio's Unix host APIs for a short buffer (ignored elsewhere)
+os.environ.setdefault('PA_MIN_LATENCY_MSEC', '5')
+# Reuse the SDK's TLS connection across recordings instead of letting
+# httpx close it after 5 idle seconds
+aai.settings.keepalive_expiry = KEEPALIVE_EXPIRY
 
 # Ensure directories exist
 os.makedirs(RECORDINGS_DIR, exist_ok=True)
 os.makedirs(COMBINED_DIR, exist_ok=True)
+os.makedirs(CACHE_DIR, exist_ok=True)
 
 # Initialize session state defaults
 defaults = {
@@ -28,17 +57,19 @@ defaults = {
     'recording_start_time': 0,
     'recordings': [],
     'input_volume': 1.0,
+    'blocksize': 1024,
     'api_key': os.getenv('ASSEMBLY_API_KEY', ''),
-    'debug': []
+    'auto_transcribe': False,
+    'combine_jobs': [],
+    'debug': deque(maxlen=DEBUG_LOG_LINES)
 }
 for key, default in defaults.items():
     if key not in st.session_state:
         st.session_state[key] = default
-if 'audio_frames' not in st.session_state:
-    st.session_state['audio_frames'] = []
 # allow users to pick which recordings to combine
-if 'combine_selection' not in st.session_state:
-    st.session_state.combine_selection = set()
+# (one flag per recording, kept in step with st.session_state.recordings)
+if 'combine_mask' not in st.session_state:
+    st.session_state.combine_mask = np.zeros(0, dtype=np.bool_)
 
 # Debug logging
 
@@ -49,51 +80,239 @@ def add_debug(msg):
 # Transcribe audio via AssemblyAI
 
 
-def transcribe_audio(path, api_key):
+@st.cache_resource
+def get_transcription_pool():
+    """Process-wide worker pool plus a semaphore bounding jobs in flight"""
+    return (ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS),
+            threading.BoundedSemaphore(TRANSCRIBE_WORKERS))
+
+
+def transcribe_chunked(path, transcriber, slots):
+    """Transcribe a long WAV as overlapping chunks submitted in parallel"""
+    frame_bytes = CHANNELS * 2
+    chunk = CHUNK_SECONDS * SAMPLE_RATE
+    overlap = int(CHUNK_OVERLAP * SAMPLE_RATE)
+    with open(path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        nframes = (len(mm) - WAV_HEADER_SIZE) // frame_bytes
+        starts = list(range(0, nframes, chunk))
+        if len(starts) > 1 and nframes - starts[-1] < MIN_CHUNK_SECONDS * SAMPLE_RATE:
+            starts.pop()  # A short tail rides along with the previous chunk
+        spans = iter(zip(starts, starts[1:] + [nframes]))
+
+        # Each chunk carries CHUNK_OVERLAP either side so a word cut at a
+        # boundary is heard whole; only the chunk owning its start keeps it
+        def submit(span):
+            start, end = span
+            lo = max(0, start - overlap)
+            hi = min(nframes, end + overlap)
+            pcm = mm[WAV_HEADER_SIZE + lo * frame_bytes:WAV_HEADER_SIZE + hi * frame_bytes]
+            payload = pcm_wav_header((hi - lo) * CHANNELS) + pcm
+            return span, lo, transcriber.transcribe_async(payload)
+
+        def collect(item):
+            (start, end), lo, future = item
+            result = future.result()
+            if result.status == aai.TranscriptStatus.error:
+                raise RuntimeError(result.error)
+            for w in result.words or []:
+                t = lo / SAMPLE_RATE + w.start / 1000.0
+                if start / SAMPLE_RATE <= t < end / SAMPLE_RATE:
+                    words.append([t, w.text])
+
+        # The job's own slot covers one chunk in flight; each further chunk
+        # borrows a free slot, so chunks count against TRANSCRIBE_WORKERS too
+        pending = deque()
+        borrowed = 0
+        words = []
+        try:
+            for span in spans:
+                while len(pending) > borrowed:
+                    if slots.acquire(blocking=False):
+                        borrowed += 1
+                    else:
+                        collect(pending.popleft())
+                # Payloads are sliced only once a slot is free
+                pending.append(submit(span))
+            while pending:
+                collect(pending.popleft())
+                if borrowed and borrowed >= len(pending):
+                    slots.release()  # Not needed for what is left in flight
+                    borrowed -= 1
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+            # Uploads already running cannot be cancelled; their slots stay
+            # taken until they finish
+            wait([future for _, _, future in pending])
+            for _ in range(borrowed):
+                slots.release()
+    text = " ".join(word for _, word in words)
+    return {'text': text or 'No transcription', 'words': words}
+
+
+def transcribe_audio(path, transcriber, slots):
+    # Runs on a worker thread: no st.session_state access in here
+    duration = (os.path.getsize(path) - WAV_HEADER_SIZE) / (CHANNELS * 2 * SAMPLE_RATE)
+    if duration > CHUNK_SECONDS:
+        return transcribe_chunked(path, transcriber, slots)
+    result = transcriber.transcribe(path)
+    if result.status == aai.TranscriptStatus.error:
+        raise RuntimeError(result.error)
+    # Word timings (seconds) let a combined transcript be split per recording
+    words = [[w.start / 1000.0, w.text] for w in result.words or []]
+    return {'text': getattr(result, 'text', '') or 'No transcription', 'words': words}
+
+
+def submit_transcription(path, api_key, digest=None):
     if not api_key:
         add_debug("No API key for transcription")
-        return ''
-    aai.settings.api_key = api_key
+        return None
+    executor, slots = get_transcription_pool()
+    # The Transcriber's own pool runs the chunks of long recordings; the
+    # slots below still bound them
+    transcriber = get_transcriber(api_key, TRANSCRIBE_WORKERS)
+    # The pool is shared by every session, so never block this script
+    # thread waiting for a slot; the caller treats None as "not queued"
+    if not slots.acquire(blocking=False):
+        st.warning("Transcription queue is full, please try again shortly")
+        add_debug(f"Transcription queue full, skipped {path}")
+        return None
     add_debug(f"Transcribing {path}")
-    transcriber = aai.Transcriber()
-    result = transcriber.transcribe(path)
-    text = getattr(result, 'text', '') or 'No transcription'
-    add_debug(f"Received transcription ({len(text)} chars)")
-    return text
+
+    def task():
+        try:
+            return cached_transcribe(
+                CACHE_DIR, path, lambda p: transcribe_audio(p, transcriber, slots), digest)
+        finally:
+            slots.release()
+    return executor.submit(task)
+
+
+def collect_transcriptions():
+    for rec in st.session_state.recordings:
+        future = rec.get('future')
+        if future is None or not future.done():
+            continue
+        try:
+            rec['text'] = future.result()['text']
+            add_debug(f"Received transcription ({len(rec['text'])} chars)")
+        except Exception as e:
+            rec['text'] = f"Transcription failed: {e}"
+            add_debug(f"Transcription error for {rec['filepath']}: {e}")
+        rec['future'] = None
+
+    # A combined transcript is split back onto its source recordings
+    for job in [j for j in st.session_state.combine_jobs if j['future'].done()]:
+        st.session_state.combine_jobs.remove(job)
+        try:
+            words = job['future'].result()['words']
+        except Exception as e:
+            add_debug(f"Transcription error for {job['filepath']}: {e}")
+            continue
+        starts = [start for start, _ in job['segments']]
+        texts = [[] for _ in starts]
+        for start, word in words:
+            texts[max(0, bisect_right(starts, start) - 1)].append(word)
+        for (_, idx), seg_words in zip(job['segments'], texts):
+            rec = st.session_state.recordings[idx]
+            if rec['future'] is None and not rec['text']:
+                rec['text'] = " ".join(seg_words) or 'No transcription'
+        add_debug(f"Split combined transcription across {len(starts)} recordings")
 
 # Combine recordings into one WAV
 
 
+def pcm_wav_header(nsamples):
+    """44-byte header for 16-bit PCM at the app's rate and channel count"""
+    data_len = nsamples * 2
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_len, b'WAVE',
+        b'fmt ', 16, 1, CHANNELS, SAMPLE_RATE, SAMPLE_RATE * CHANNELS * 2,
+        CHANNELS * 2, 16,
+        b'data', data_len
+    )
+
+
 def combine_audio_files():
-    selected_indices = st.session_state.combine_selection
-    if not selected_indices:
+    """Concatenate the selected recordings; returns (path, [(start_s, index)])"""
+    selected_indices = np.flatnonzero(st.session_state.combine_mask)
+    if not selected_indices.size:
         add_debug("No recordings selected for combining")
-        return None
+        return None, []
 
-    segments = []
-    for idx in selected_indices:
+    # Frame counts were stored at record time, so the output can be sized
+    # without opening any file; our takes always have the canonical header
+    sources = []
+    total = 0
+    for idx in selected_indices.tolist():
         rec = st.session_state.recordings[idx]
         try:
-            with wave.open(rec['filepath'], 'rb') as wf:
-                data = wf.readframes(wf.getnframes())
-                arr = np.frombuffer(data, dtype=np.int16)
-                segments.append(arr)
-        except Exception as e:
-            add_debug(f"Error reading {rec['filepath']}: {e}")
-
-    if not segments:
-        return None
-
-    combined = np.concatenate(segments)
+            stat = os.stat(rec['filepath'])
+        except OSError:
+            add_debug(f"Missing recording: {rec['filepath']}")
+            continue
+        n = rec['nframes'] * CHANNELS
+        if stat.st_size < WAV_HEADER_SIZE + n * 2:
+            add_debug(f"Skipping truncated recording: {rec['filepath']}")
+            continue
+        key = (rec['filepath'], stat.st_mtime_ns, stat.st_size)
+        sources.append((idx, key, WAV_HEADER_SIZE, n))
+        total += n
+
+    if not total:
+        return None, []
+
+    # The output is sized up front and mapped, so the OS pages it out as it
+    # fills and memory stays bounded however long the combination is
     filename = f"combined_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.wav"
     out_path = os.path.join(COMBINED_DIR, filename)
-    with wave.open(out_path, 'wb') as wf:
-        wf.setnchannels(CHANNELS)
-        wf.setsampwidth(2)
-        wf.setframerate(SAMPLE_RATE)
-        wf.writeframes(combined.tobytes())
+    try:
+        with open(out_path, 'wb') as f:
+            f.write(pcm_wav_header(total))
+            f.truncate(WAV_HEADER_SIZE + total * 2)
+        combined = np.memmap(out_path, dtype=np.int16, mode='r+',
+                             offset=WAV_HEADER_SIZE, shape=(total,))
+        offset = 0
+        segments = []
+        first_copy = {}  # (path, mtime, size) -> where that file already landed
+        for idx, key, data_offset, n in sources:
+            segments.append((offset / CHANNELS / SAMPLE_RATE, idx))
+            if key in first_copy:
+                # Same file selected again (identical takes share a file):
+                # duplicate the samples already in the output, no re-read
+                src = first_copy[key]
+                for start in range(0, n, COPY_BLOCK):
+                    stop = min(start + COPY_BLOCK, n)
+                    combined[offset + start:offset + stop] = combined[src + start:src + stop]
+                offset += n
+                continue
+            first_copy[key] = offset
+            # Map the source and copy its PCM from the page cache block by block
+            with open(key[0], 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, 'madvise'):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                pcm = np.frombuffer(mm, dtype=np.int16, count=n, offset=data_offset)
+                for start in range(0, n, COPY_BLOCK):
+                    stop = min(start + COPY_BLOCK, n)
+                    combined[offset + start:offset + stop] = pcm[start:stop]
+                del pcm  # Release the view so the map can close
+            offset += n
+        combined.flush()
+        del combined
+    except (OSError, ValueError) as e:
+        # A source that cannot be read leaves no half-filled output behind
+        combined = None
+        try:
+            os.remove(out_path)
+        except OSError:
+            pass
+        add_debug(f"Combining failed: {e}")
+        return None, []
     add_debug(f"Combined WAV saved: {out_path}")
-    return out_path
+    return out_path, segments
 
 # Callback for tag changes
 
@@ -107,44 +326,172 @@ def on_tag_change(idx):
 # App UI
 st.title("🎙️ Voice Recorder with Tags")
 
-# Audio Settings
-with st.expander("Audio Settings", expanded=True):
-    st.session_state.input_volume = st.slider(
-        "Input Volume Multiplier", 0.1, 5.0,
-        value=st.session_state.input_volume, step=0.1
-    )
+# Settings form: edits only rerun the script once Apply is pressed
+with st.form("settings", clear_on_submit=False):
+    # Audio Settings
+    with st.expander("Audio Settings", expanded=True):
+        volume = st.slider(
+            "Input Volume Multiplier", 0.1, 5.0,
+            value=st.session_state.input_volume, step=0.1
+        )
+        # Larger blocks mean fewer callbacks (and GIL handoffs) per second
+        blocksize = st.select_slider(
+            "Callback Block Size (frames)", BLOCKSIZE_OPTIONS,
+            value=st.session_state.blocksize,
+            format_func=lambda n: "Auto" if n == 0 else str(n)
+        )
 
-# API Key Input
-with st.expander("API Settings", expanded=False):
-    key = st.text_input(
-        "AssemblyAI API Key", value=st.session_state.api_key, type='password'
-    )
-    if key != st.session_state.api_key:
-        st.session_state.api_key = key
-        add_debug("API key updated")
+    # API Key Input
+    with st.expander("API Settings", expanded=False):
+        key = st.text_input(
+            "AssemblyAI API Key", value=st.session_state.api_key, type='password'
+        )
+        # Off by default: combining transcribes many takes in one request
+        auto_transcribe = st.checkbox(
+            "Auto-transcribe on stop", value=st.session_state.auto_transcribe
+        )
+
+    if st.form_submit_button("Apply Settings", use_container_width=True):
+        st.session_state.input_volume = volume
+        st.session_state.blocksize = blocksize
+        st.session_state.auto_transcribe = auto_transcribe
+        if key != st.session_state.api_key:
+            st.session_state.api_key = key
+            add_debug("API key updated")
+
+# Real-time scheduling
+
+
+def raise_thread_priority(priority):
+    """Best-effort SCHED_FIFO for the calling thread (Linux, needs CAP_SYS_NICE)"""
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        return True
+    except (AttributeError, OSError):
+        return False
+
+
+def write_frames(ring, out, stop_event, volume, hasher):
+    """Drain the ring into an open WAV file (and hasher) until recording stops"""
+    raise_thread_priority(WRITER_PRIORITY)
+    # Q8 fixed-point gain: int32 multiply, shift back, saturate to int16
+    gain = int(round(volume * 256))
+    if gain == 256:
+        # Unity gain: the captured int16 is written as-is, straight from
+        # the ring, with no arithmetic or staging copy
+        while True:
+            stopping = stop_event.is_set()
+            for block in ring.drain():
+                out.write(block)
+                hasher.update(block)
+            if stopping:
+                break
+            stop_event.wait(0.05)
+        return
+    # Staging buffers allocated once per session, reused for every drain
+    acc = np.empty(ring.buf.size, dtype=np.int32)
+    data16 = np.empty(ring.buf.size, dtype=np.int16)
+    while True:
+        stopping = stop_event.is_set()
+        n = 0
+        for block in ring.drain():
+            samples = block.reshape(-1)
+            np.multiply(samples, gain, out=acc[n:n + samples.size], dtype=np.int32)
+            n += samples.size
+        if n:
+            # Saturate before the shift so the shift can narrow straight to int16
+            np.clip(acc[:n], -32768 << 8, 32767 << 8, out=acc[:n])
+            np.right_shift(acc[:n], 8, out=data16[:n], casting='unsafe')
+            # Plain file write of a view: no copy, no per-block header patch
+            out.write(data16[:n])
+            hasher.update(data16[:n])
+        if stopping:
+            break
+        stop_event.wait(0.05)
 
 # Recording Controls
 
 
 def record_controls():
-    frames = st.session_state.audio_frames
     col1, col2 = st.columns(2)
     if not st.session_state.is_recording:
         if col1.button("Start Recording", use_container_width=True):
-            frames.clear()
+            ring = RingBuffer(RING_SECONDS * SAMPLE_RATE, CHANNELS)
+            prioritized = False
+            # The callback runs outside the script thread and must not touch
+            # st.session_state; status flags are tallied and logged on stop
+            statuses = Counter()
 
             def callback(indata, _, __, status):
+                nonlocal prioritized
+                if not prioritized:
+                    # First call runs on PortAudio's own thread
+                    prioritized = True
+                    raise_thread_priority(CALLBACK_PRIORITY)
                 if status:
-                    add_debug(f"Stream status: {status}")
-                frames.append(indata.copy())
-            stream = sd.InputStream(
-                samplerate=SAMPLE_RATE,
-                channels=CHANNELS,
-                dtype='float32',
-                callback=callback
-            )
-            stream.start()
+                    statuses[str(status)] += 1
+                ring.write(indata)
+            # Recordings are combined and chunked at one fixed rate, so a
+            # device that cannot capture at it is refused rather than resampled
+            try:
+                sd.check_input_settings(channels=CHANNELS, dtype='int16', samplerate=SAMPLE_RATE)
+            except Exception as e:
+                st.error(f"The selected microphone cannot record at {SAMPLE_RATE} Hz. "
+                         "Choose another input device or set its sample rate in your OS sound settings.")
+                add_debug(f"Unsupported input settings: {e}")
+                return
+            # Raw stream: the callback gets PortAudio's buffer as-is, no ndarray.
+            # Opened first, so a device that rejects the settings fails
+            # before any file or thread exists
+            try:
+                stream = sd.RawInputStream(
+                    samplerate=SAMPLE_RATE,
+                    channels=CHANNELS,
+                    dtype='int16',
+                    blocksize=st.session_state.blocksize,
+                    latency='low',
+                    callback=callback
+                )
+            except Exception as e:
+                st.error(f"Could not open the microphone: {e}")
+                add_debug(f"Stream open failed: {e}")
+                return
+            fname = f"recording_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.wav"
+            fpath = os.path.join(RECORDINGS_DIR, fname)
+            stop_event = threading.Event()
+            hasher = hashlib.blake2b(digest_size=16)
+            out = writer = None
+            errors = []  # Filled by the writer if a disk write fails
+            try:
+                # Placeholder header; the real lengths are written once on stop
+                out = open(fpath, 'wb')
+                out.write(pcm_wav_header(0))
+                writer = threading.Thread(
+                    target=keep_errors,
+                    args=(errors, write_frames, ring, out, stop_event,
+                          st.session_state.input_volume, hasher),
+                    daemon=True
+                )
+                writer.start()
+                stream.start()
+            except Exception as e:
+                # Undo whatever was set up: no stray thread, handle or file
+                stop_event.set()
+                if writer is not None and writer.is_alive():
+                    writer.join()
+                stream.close()
+                if out is not None:
+                    out.close()
+                    os.remove(fpath)
+                st.error(f"Could not start recording: {e}")
+                add_debug(f"Recording start failed: {e}")
+                return
             st.session_state.stream = stream
+            st.session_state.capture = {
+                'ring': ring, 'out': out, 'fpath': fpath, 'statuses': statuses,
+                'stop_event': stop_event, 'writer': writer, 'hasher': hasher,
+                'errors': errors
+            }
             st.session_state.is_recording = True
             st.session_state.recording_start_time = time.time()
             add_debug("Recording started")
@@ -154,69 +501,129 @@ def record_controls():
             if stream:
                 stream.stop()
                 stream.close()
+            capture = st.session_state.capture
+            capture['stop_event'].set()
+            capture['writer'].join()
             st.session_state.is_recording = False
             add_debug("Recording stopped")
-            if not frames:
+            out, ring, fpath = capture['out'], capture['ring'], capture['fpath']
+            for status, count in capture['statuses'].items():
+                add_debug(f"Stream status: {status} (x{count})")
+            if ring.overflows:
+                add_debug(f"Dropped {ring.overflows} blocks (writer overrun)")
+            error = capture['errors'][0] if capture['errors'] else None
+            if error is None:
+                try:
+                    out.seek(0)
+                    out.write(pcm_wav_header(ring.write_idx * CHANNELS))
+                    out.close()
+                except OSError as e:
+                    error = e
+            if error is not None:
+                # The file is missing audio the header would claim: drop the take
+                try:
+                    out.close()
+                except OSError:
+                    pass
+                os.remove(fpath)
+                st.error(f"Could not save the recording: {error}")
+                add_debug(f"WAV write failed: {error}")
+            elif not ring.write_idx:
+                os.remove(fpath)
                 st.error("No audio captured. Check mic or close other apps.")
-                add_debug("audio_frames empty")
+                add_debug("ring buffer empty")
             else:
-                audio = np.concatenate(frames, axis=0).flatten()
-                audio = np.clip(
-                    audio * st.session_state.input_volume, -1.0, 1.0)
-                data16 = (audio * 32767).astype(np.int16)
-                fname = f"recording_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.wav"
-                fpath = os.path.join(RECORDINGS_DIR, fname)
-                with wave.open(fpath, 'wb') as wf:
-                    wf.setnchannels(CHANNELS)
-                    wf.setsampwidth(2)
-                    wf.setframerate(SAMPLE_RATE)
-                    wf.writeframes(data16.tobytes())
-                add_debug(f"Saved WAV: {fpath}")
+                # Name the take by its content: an identical take is stored once
+                digest = capture['hasher'].hexdigest()
+                final_path = os.path.join(RECORDINGS_DIR, f"rec_{digest}.wav")
+                if os.path.exists(final_path):
+                    os.remove(fpath)
+                    add_debug(f"Identical take already saved: {final_path}")
+                else:
+                    os.replace(fpath, final_path)
+                    add_debug(f"Saved WAV: {final_path}")
+                fpath = final_path
                 st.audio(fpath)
-                with st.spinner("Transcribing..."):
-                    txt = transcribe_audio(fpath, st.session_state.api_key)
-                st.success("Transcription complete 🎉")
-                st.write(f"📝 {txt}")
+                future = None
+                if st.session_state.auto_transcribe:
+                    future = submit_transcription(fpath, st.session_state.api_key, digest)
+                if future:
+                    st.info("Transcribing in the background ⏳")
                 st.session_state.recordings.append({
                     'filepath': fpath,
-                    'duration': len(audio)/SAMPLE_RATE,
-                    'text': txt,
+                    'digest': digest,
+                    'nframes': ring.write_idx,
+                    'duration': ring.write_idx/SAMPLE_RATE,
+                    'text': None if future else '',
+                    'future': future,
                     'tag': TAG_OPTIONS[0]
                 })
+                st.session_state.combine_mask = np.append(
+                    st.session_state.combine_mask, False)
 
 
 with st.container():
     record_controls()
 
 # Combine Selected Recordings Button
-selected_count = len(st.session_state.combine_selection)
+selected_count = int(st.session_state.combine_mask.sum())
 button_text = f"Combine Selected ({selected_count})" if selected_count > 0 else "Select recordings to combine"
 if st.button(button_text, use_container_width=True, disabled=selected_count == 0):
-    combined_path = combine_audio_files()
+    combined_path, segments = combine_audio_files()
     if combined_path:
         st.success(f"Combined audio saved: {combined_path}")
         st.audio(combined_path)
+        # One request for the whole selection instead of one per recording
+        if any(not st.session_state.recordings[idx]['text'] for _, idx in segments):
+            future = submit_transcription(combined_path, st.session_state.api_key)
+            if future:
+                st.session_state.combine_jobs.append({
+                    'filepath': combined_path, 'segments': segments, 'future': future
+                })
+                st.info("Transcribing the combined audio in the background ⏳")
     else:
         st.warning("Failed to combine recordings")
 
-# Live status
-if st.session_state.is_recording:
+# Live status, ticking once a second without rerunning the whole script
+
+
+@st.fragment(run_every=1)
+def recording_status():
     elapsed = time.time() - st.session_state.recording_start_time
     st.write(f"🔴 Recording... {elapsed:.1f}s")
 
+
+if st.session_state.is_recording:
+    recording_status()
+
+# Pick up transcriptions finished since the last run
+collect_transcriptions()
+
 # List recordings with tag selector
-st.markdown("---")
-total = len(st.session_state.recordings)
-for rev_idx, rec in enumerate(reversed(st.session_state.recordings)):
-    orig_idx = total - 1 - rev_idx
+
+
+@st.cache_resource(max_entries=4 * PAGE_SIZE, show_spinner=False)
+def get_audio_bytes(path, mtime):
+    # Takes are immutable once written, so path + mtime identifies the bytes
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@st.fragment
+def render_recording(orig_idx):
+    # Widgets in here rerun only this recording, not the whole list
+    rec = st.session_state.recordings[orig_idx]
 
     # Add selection checkbox
     col1, col2 = st.columns([1, 10])
     with col1:
-        if st.checkbox("", key=f"select_{orig_idx}"):
-            st.session_state.combine_selection.add(orig_idx)
-        else:
-            st.session_state.combine_selection.discard(orig_idx)
+        # Seeded from the mask so a take paged out and back stays selected
+        selected = st.checkbox(
+            "", value=bool(st.session_state.combine_mask[orig_idx]),
+            key=f"select_{orig_idx}")
+        if selected != st.session_state.combine_mask[orig_idx]:
+            st.session_state.combine_mask[orig_idx] = selected
+            st.rerun()  # Refresh the Combine Selected count
 
     with col2:
         st.subheader(f"Recording {orig_idx+1}")
@@ -225,9 +632,15 @@ for rev_idx, rec in enumerate(reversed(st.session_state.recordings)):
         st.markdown(
             f"<span style='background-color:#444;color:#fff;padding:4px 8px;border-radius:4px;'>{badge}</span>", unsafe_allow_html=True)
         # Audio + details
-        st.audio(rec['filepath'])
+        path = rec['filepath']
+        st.audio(get_audio_bytes(path, os.path.getmtime(path)), format="audio/wav")
         st.write(f"⏱️ Duration: {rec.get('duration', 0):.2f}s")
-        st.write(f"📝 {rec.get('text', '')}")
+        if rec.get('text') is None:
+            st.write("⏳ Transcribing...")
+        elif not rec['text']:
+            st.write("📝 Not transcribed yet (combine to transcribe)")
+        else:
+            st.write(f"📝 {rec['text']}")
         # Tag dropdown with on_change callback
         st.selectbox(
             "Change Tag", TAG_OPTIONS,
@@ -237,7 +650,32 @@ for rev_idx, rec in enumerate(reversed(st.session_state.recordings)):
             args=(orig_idx,)
         )
 
+
+st.markdown("---")
+total = len(st.session_state.recordings)
+shown = total
+if total > PAGE_SIZE and not st.checkbox(f"Show older recordings ({total - PAGE_SIZE})"):
+    shown = PAGE_SIZE
+for orig_idx in range(total - 1, total - 1 - shown, -1):
+    render_recording(orig_idx)
+
 # Debug log
 with st.expander("Debug Log", expanded=False):
-    for msg in st.session_state.debug:
-        st.write(msg)
+    # One element for the whole log instead of one per message
+    st.code("\n".join(st.session_state.debug), language=None)
+
+# Rerun the page only once a background transcription has finished
+
+
+@st.fragment(run_every=1)
+def transcription_watcher():
+    futures = [rec['future'] for rec in st.session_state.recordings
+               if rec.get('future') is not None]
+    futures += [job['future'] for job in st.session_state.combine_jobs]
+    if any(future.done() for future in futures):
+        st.rerun()
+
+
+if st.session_state.combine_jobs or any(
+        rec.get('future') is not None for rec in st.session_state.recordings):
+    transcription_watcher()